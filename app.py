@@ -4,8 +4,15 @@ import random
 import datetime
 import re
 import csv
+import zlib
+import base64
+import hashlib
+import time
+import sys
+import bisect
+from collections.abc import Mapping
 from io import StringIO
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from authlib.integrations.flask_client import OAuth
@@ -35,6 +42,85 @@ google_auth = oauth.register(
 
 ACTIVE_GAMES = {}
 
+# collections 시트 샤드 개수 (user_id 해시로 분산, 1이면 기존 단일 시트)
+# 샤드는 같은 memory_game_db 안의 워크시트이므로 유저별 조회 범위만 줄어듦.
+# 스프레드시트 전체 셀 한도(1,000만 셀)는 그대로이며, 별도 스프레드시트 분산은 아직 하지 않음
+# COLLECTION_SHARDS를 바꾸면 meta 시트에 기록된 샤드 수와 달라져 앱이 점검 모드(503)로 들어가며,
+# `flask rebalance-collections`가 끝나야 풀림 (그 사이 빈 샤드로 라우팅되어 XP가 중복 지급되는 것 방지)
+COLLECTION_SHARDS = max(1, int(os.environ.get('COLLECTION_SHARDS', '1') or 1))
+MAINTENANCE_CHECK_TTL = 10  # 점검 플래그(meta 시트) 재조회 간격(초)
+SHEET_WRITE_CHUNK_CHARS = 1000000  # 시트 통째 쓰기 시 요청 1건당 최대 글자 수 (Sheets 요청 크기 한도 대비)
+
+# 본문 저장소: 셀에는 "@body:<sha256>" 참조만 두고 본문은 bodies 시트에 압축/분할 저장
+BODY_REF_PREFIX = "@body:"
+BODY_CHUNK_SIZE = 40000  # 구글 시트 셀 한도(50,000자) 이하
+BODY_RELOAD_INTERVAL = 30  # 없는 해시/읽기 실패 후 bodies 시트 재조회 최소 간격(초)
+BODY_UNAVAILABLE_MSG = "카드 본문을 불러오지 못했습니다. 잠시 후 다시 시도해주세요."
+
+# 페이지 ETag 유효 구간(초). 시트를 직접 수정한 경우에도 이 시간 안에 반영됨
+PAGE_ETAG_TTL = int(os.environ.get('PAGE_ETAG_TTL', '300') or 300)
+
+# 시트 테이블 메모리 캐시 유효 시간(초). 읽기 전용 화면에만 쓰이며 자체 쓰기 후에는 즉시 폐기됨
+TABLE_CACHE_TTL = int(os.environ.get('TABLE_CACHE_TTL', '30') or 30)
+
+# 리더보드 집계 전체 재계산 주기(초). 그 사이에는 mutator가 증분 갱신
+STATS_REBUILD_TTL = int(os.environ.get('STATS_REBUILD_TTL', '600') or 600)
+
+# 연속 학습(세션 모드) 한 번에 불러올 최대 카드 수
+SESSION_MAX_CARDS = int(os.environ.get('SESSION_MAX_CARDS', '30') or 30)
+
+# 로비에 보여줄 리더보드 인원
+LOBBY_LEADERS = 5
+
+def to_int(value, default=0):
+    # 빈 값만 기본값으로 처리 ("0"은 0). 숫자가 아닌 값도 기본값
+    if value is None or value == "": return default
+    try: return int(value)
+    except (TypeError, ValueError): return default
+
+class SheetRow(Mapping):
+    # 헤더를 공유하는 읽기 전용 행. 기존 코드의 dict 사용법(get, [], in, items)을 그대로 지원
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class SheetTable:
+    # get_all_values() 결과를 한 번만 파싱해 두는 압축 테이블
+    NUMERIC_COLUMNS = ('level', 'xp', 'points')
+
+    def __init__(self, rows):
+        headers = rows[0] if rows else []
+        self.headers = [sys.intern(h) for h in headers]
+        self.index = {h: i for i, h in enumerate(self.headers)}
+        numeric = {self.index[c] for c in self.NUMERIC_COLUMNS if c in self.index}
+        width = len(self.headers)
+        self.rows = []
+        for row in rows[1:]:
+            values = []
+            for i, v in enumerate(row[:width]):
+                # 숫자 열이라도 int()가 못 읽는 셀('²', '①' 등)은 문자열로 남김 (셀 하나 때문에 테이블 전체가 깨지지 않도록)
+                if i in numeric and v.strip():
+                    try: v = int(v)
+                    except ValueError: pass
+                if isinstance(v, str) and len(v) <= 100: v = sys.intern(v)
+                values.append(v)
+            values.extend([""] * (width - len(values)))
+            self.rows.append(SheetRow(self.index, tuple(values)))
+
 class GoogleSheetManager:
     def __init__(self):
         self.client = None
@@ -42,14 +128,36 @@ class GoogleSheetManager:
         self.users_ws = None
         self.quests_ws = None
         self.collections_ws = None
+        self.collection_shards = []
         self.abbrev_ws = None
         self.quest_log_ws = None
+        self.bodies_ws = None
+        self._body_blobs = None
+        self._body_missing = {}
+        self._body_retry_at = 0
+        self.rename_journal_ws = None
+        self.meta_ws = None
+        self._meta = {}
+        self._meta_checked_at = 0
+        self.pending_renames = []
+        self._replaying = False
+        
+        # 테이블 버전 카운터 (mutator가 올림). 전체 변경은 versions, 유저 단위 변경은 user_versions
+        self.boot_id = f"{os.getpid()}-{time.time():.0f}"
+        self.versions = {}
+        self.user_versions = {}
+        self._quest_view_cache = None
+        self._table_cache = {}
+        self._stats = None
         
         self.USER_HEADERS = ["user_id", "password", "level", "xp", "title", "last_idx", "points", "nickname"]
         self.QUEST_HEADERS = ["quest_name", "content", "creator", "date"]
         self.COLLECTION_HEADERS = ["user_id", "card_text", "grade", "date", "quest_name", "level", "type"]
         self.ABBREV_HEADERS = ["user_id", "quest_name", "mnemonic", "date"]
         self.QUEST_LOG_HEADERS = ["user_id", "last_daily_login"]
+        self.BODY_HEADERS = ["hash", "chunk", "data"]
+        self.RENAME_JOURNAL_HEADERS = ["old_name", "new_name", "date"]
+        self.META_HEADERS = ["key", "value"]
         self.connect_db() 
 
     def connect_db(self):
@@ -63,10 +171,19 @@ class GoogleSheetManager:
             self.sheet = self.client.open("memory_game_db")
             
             self.users_ws = self._get_or_create_sheet("users", self.USER_HEADERS)
-            self.collections_ws = self._get_or_create_sheet("collections", self.COLLECTION_HEADERS)
+            self.collection_shards = [self._get_or_create_sheet(self._collection_shard_title(i), self.COLLECTION_HEADERS) for i in range(COLLECTION_SHARDS)]
+            self.collections_ws = self.collection_shards[0]
             self.quests_ws = self._get_or_create_sheet("quests", self.QUEST_HEADERS)
             self.abbrev_ws = self._get_or_create_sheet("abbreviations", self.ABBREV_HEADERS)
             self.quest_log_ws = self._get_or_create_sheet("quest_log", self.QUEST_LOG_HEADERS)
+            self.bodies_ws = self._get_or_create_sheet("bodies", self.BODY_HEADERS)
+            self.rename_journal_ws = self._get_or_create_sheet("rename_journal", self.RENAME_JOURNAL_HEADERS)
+            self.meta_ws = self._get_or_create_sheet("meta", self.META_HEADERS)
+            self._table_cache = {}
+            self._load_meta()
+            # 샤딩 이전(단일 collections 시트) 데이터로 간주해 기록이 없으면 1로 남김
+            if self.meta_ws is not None and 'collection_shards' not in self._meta: self.set_meta('collection_shards', 1)
+            self.replay_renames()
             return True
         except Exception as e:
             print(f"DB Error: {e}")
@@ -84,6 +201,330 @@ class GoogleSheetManager:
                 return ws
             except: return None
 
+    # --- collections 샤드 디렉터리 ---
+    def _collection_shard_title(self, idx):
+        return "collections" if idx == 0 else f"collections_{idx}"
+
+    def _collection_shard_index(self, user_id):
+        # 프로세스마다 달라지는 hash() 대신 crc32 사용 (워커/재시작 간 동일한 샤드)
+        return zlib.crc32(str(user_id).encode('utf-8')) % max(1, len(self.collection_shards))
+
+    def _collection_ws(self, user_id):
+        if not self.collection_shards: return None
+        return self.collection_shards[self._collection_shard_index(user_id)]
+
+    # --- meta 시트 (점검 플래그, 샤드 수) ---
+    def _load_meta(self):
+        if self.meta_ws is None: return
+        try:
+            self._meta = {r[0]: r[1] if len(r) > 1 else "" for r in self.meta_ws.get_all_values()[1:] if r and r[0]}
+            self._meta_checked_at = time.time()
+        except Exception as e: print(f"Meta Error: {e}")
+
+    def set_meta(self, key, value):
+        rows = self.meta_ws.get_all_values()
+        for i, r in enumerate(rows):
+            if i > 0 and r and r[0] == key:
+                self.meta_ws.update_cell(i + 1, 2, str(value))
+                break
+        else: self.meta_ws.append_row([key, str(value)])
+        self._meta[key] = str(value)
+
+    def maintenance_reason(self):
+        # 점검 중이면 사유 문자열, 아니면 None (MAINTENANCE_CHECK_TTL마다 meta 시트 재조회)
+        if time.time() - self._meta_checked_at > MAINTENANCE_CHECK_TTL: self._load_meta()
+        if self._meta.get('maintenance') == '1': return "데이터 정리 작업 중"
+        shards = self._meta.get('collection_shards')
+        if shards and to_int(shards, 1) != COLLECTION_SHARDS: return "collections 샤드 재배치 대기 중 (flask rebalance-collections)"
+        return None
+
+    def _write_sheet_rows(self, ws, rows):
+        # 시트 내용을 rows로 통째로 교체. 늘릴 때는 먼저 resize, 줄일 때는 update 후 resize (중간 실패 시 행 유실 없음).
+        # 본문이 인라인으로 남은 행은 수만 자라 SHEET_WRITE_CHUNK_CHARS 단위로 나눠 보냄
+        if ws.row_count < len(rows): ws.resize(rows=len(rows))
+        start = 0
+        while start < len(rows):
+            end = start; size = 0
+            while end < len(rows) and (end == start or size + sum(len(str(v)) for v in rows[end]) <= SHEET_WRITE_CHUNK_CHARS):
+                size += sum(len(str(v)) for v in rows[end]); end += 1
+            ws.update(range_name=f"A{start + 1}", values=rows[start:end])
+            start = end
+        if ws.row_count > max(len(rows), 1): ws.resize(rows=max(len(rows), 1))
+
+    def rebalance_collection_shards(self):
+        # COLLECTION_SHARDS 변경 후 모든 collections* 시트를 읽어 샤드별로 한 번에 다시 씀.
+        # 1단계는 기존 행 + 들어올 행, 2단계에서 최종 내용으로 덮어써 중간 실패 시에도 행이 사라지지 않음.
+        # 중복 행은 (user_id, quest_name, type) 기준으로 level이 높은 것만 남기므로 재실행해도 안전함.
+        # 실행 중 들어온 쓰기는 덮어써지므로 rebalance_collections_command가 점검 플래그를 먼저 켬
+        if not self.ensure_connection(): return 0
+        existing = [ws for ws in self.sheet.worksheets() if re.fullmatch(r'collections(_\d+)?', ws.title)]
+        try:
+            width = len(self.COLLECTION_HEADERS)
+            old_rows = {ws.title: [r + [""] * (width - len(r)) for r in ws.get_all_values()[1:] if r and r[0]] for ws in existing}
+            merged = {}
+            moved = 0
+            for title, rows in old_rows.items():
+                for row in rows:
+                    key = (str(row[0]), row[4], row[6])
+                    prev = merged.get(key)
+                    if prev is None or to_int(row[5]) > to_int(prev[1][5]):
+                        merged[key] = (title, row)
+            final = {self._collection_shard_title(i): [] for i in range(COLLECTION_SHARDS)}
+            for key, (title, row) in merged.items():
+                dst = self._collection_shard_title(self._collection_shard_index(row[0]))
+                final[dst].append(row)
+                if dst != title: moved += 1
+            targets = {ws.title: ws for ws in existing}
+            for title in final:
+                if title not in targets: targets[title] = self._get_or_create_sheet(title, self.COLLECTION_HEADERS)
+            for title, ws in targets.items():
+                current = {tuple(r) for r in old_rows.get(title, [])}
+                incoming = [r for r in final.get(title, []) if tuple(r) not in current]
+                self._write_sheet_rows(ws, [self.COLLECTION_HEADERS] + old_rows.get(title, []) + incoming)
+            for title, ws in targets.items():
+                self._write_sheet_rows(ws, [self.COLLECTION_HEADERS] + final.get(title, []))
+            self.set_meta('collection_shards', COLLECTION_SHARDS)
+            return moved
+        finally:
+            self._invalidate(*existing, *self.collection_shards)
+            self._bump('collections')
+            self._stats = None
+
+    def migrate_inline_bodies(self):
+        # quests.content / collections*.card_text(B열)에 본문이 직접 들어 있는 행을 bodies 참조로 바꿈.
+        # SHEET_WRITE_CHUNK_CHARS 단위로 bodies에 저장한 뒤 해당 구간의 B열만 덮어씀 (재실행 시 이미 바뀐 행은 건너뜀).
+        # 예전 코드가 45,000자에서 잘라 저장한 본문은 복구되지 않음
+        if not self.ensure_connection() or self.bodies_ws is None: return 0
+        sheets = [self.quests_ws] + list(self.collection_shards)
+        converted = 0
+        try:
+            for ws in sheets:
+                col = ws.col_values(2)[1:]
+                start = 0
+                while start < len(col):
+                    end = start; size = 0
+                    while end < len(col) and (end == start or size + len(col[end]) <= SHEET_WRITE_CHUNK_CHARS):
+                        size += len(col[end]); end += 1
+                    idx = [i for i in range(start, end) if col[i] and not col[i].startswith(BODY_REF_PREFIX)]
+                    if idx:
+                        for i, ref in zip(idx, self.put_bodies([col[i] for i in idx])): col[i] = ref
+                        ws.update(range_name=f"B{start + 2}", values=[[v] for v in col[start:end]])
+                        converted += len(idx)
+                    start = end
+            return converted
+        finally:
+            self._invalidate(*sheets)
+            self._bump('quests'); self._bump('collections')
+            self._stats = None
+
+    # --- 본문 저장소 (해시 주소, 중복 제거) ---
+    def _load_body_index(self):
+        # 읽기 실패 시 기존 인덱스를 유지하고 BODY_RELOAD_INTERVAL 동안 재시도하지 않음
+        if self.bodies_ws is None: return False
+        try:
+            rows = self.bodies_ws.get_all_values()
+        except Exception as e:
+            print(f"Body index Error: {e}")
+            self._body_retry_at = time.time() + BODY_RELOAD_INTERVAL
+            return False
+        chunks = {}
+        for row in rows[1:]:
+            if len(row) < 3 or not row[0]: continue
+            try: chunks.setdefault(row[0], {})[int(row[1] or 0)] = row[2]
+            except ValueError: continue
+        self._body_blobs = {h: ''.join(c[i] for i in sorted(c)) for h, c in chunks.items()}
+        return True
+
+    def put_bodies(self, texts):
+        # 같은 본문은 한 번만 저장하고 참조 문자열 목록을 돌려줌
+        if self.bodies_ws is None: return [t[:45000] for t in texts]
+        if self._body_blobs is None: self._load_body_index()
+        # 인덱스를 못 읽었으면 중복 확인 없이 저장 (같은 해시/청크는 읽을 때 하나로 합쳐짐)
+        known = self._body_blobs if self._body_blobs is not None else {}
+        refs = []
+        rows_to_add = []
+        for text in texts:
+            text = text or ""
+            h = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            refs.append(BODY_REF_PREFIX + h)
+            if h in known: continue
+            blob = base64.b64encode(zlib.compress(text.encode('utf-8'), 9)).decode('ascii')
+            for i, o in enumerate(range(0, max(len(blob), 1), BODY_CHUNK_SIZE)):
+                rows_to_add.append([h, i, blob[o:o + BODY_CHUNK_SIZE]])
+            known[h] = blob
+        if rows_to_add:
+            self.bodies_ws.append_rows(rows_to_add)
+            self._bump('bodies')
+        return refs
+
+    def put_body(self, text):
+        return self.put_bodies([text])[0]
+
+    def get_body(self, value, default=""):
+        # 예전 방식(셀에 본문 직접 저장)도 그대로 통과. 참조를 풀지 못하면 default (저장 경로에서는 None으로 받아 중단)
+        value = str(value or "")
+        if not value.startswith(BODY_REF_PREFIX): return value
+        h = value[len(BODY_REF_PREFIX):]
+        if self._body_blobs is None or h not in self._body_blobs:
+            # 다른 워커가 저장한 본문일 수 있으므로 재조회하되, 같은 해시는 BODY_RELOAD_INTERVAL에 한 번만
+            now = time.time()
+            if now >= self._body_retry_at and now - self._body_missing.get(h, 0) > BODY_RELOAD_INTERVAL:
+                if self._load_body_index() and h not in self._body_blobs: self._body_missing[h] = now
+        blob = (self._body_blobs or {}).get(h)
+        if blob is None: return default
+        try: return zlib.decompress(base64.b64decode(blob)).decode('utf-8')
+        except Exception: return default
+
+    # --- 버전 카운터 / ETag ---
+    def _bump(self, *tables, user_id=None):
+        for t in tables:
+            if user_id is None: self.versions[t] = self.versions.get(t, 0) + 1
+            else:
+                key = (t, str(user_id))
+                self.user_versions[key] = self.user_versions.get(key, 0) + 1
+
+    def page_etag(self, user_id, page, tables):
+        bucket = int(time.time() // max(1, PAGE_ETAG_TTL))
+        parts = [self.boot_id, page, str(user_id), str(bucket)]
+        for t in tables:
+            parts.append(f"{t}:{self.versions.get(t, 0)}:{self.user_versions.get((t, str(user_id)), 0)}")
+        return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()
+
+    def get_quest_view(self):
+        # 전체 퀘스트 목록 + 정렬된 법령 표 + 빈칸 작성 여부를 quests 버전 단위로 캐시
+        key = (self.versions.get('quests', 0), int(time.time() // max(1, PAGE_ETAG_TTL)))
+        if self._quest_view_cache and self._quest_view_cache[0] == key: return self._quest_view_cache[1]
+        quests = self.get_quest_list()
+        aligned_structure, others = self.align_quests(quests)
+        drafted = [q.get('quest_name') for q in quests if '{' in self.get_body(q.get('content', ''))]
+        view = (quests, aligned_structure, others, drafted)
+        if quests and time.time() >= self._body_retry_at: self._quest_view_cache = (key, view)
+        return view
+
+    # --- 리더보드 / 통계 (메모리 집계) ---
+    # ETag용 버전: 'leaderboard'는 로비 상위 LOBBY_LEADERS가 바뀔 때(전체) 또는 내 순위가 바뀔 때(유저별),
+    # 'leaderboard_all'은 전체 순위/법령 통계가 바뀔 때 올림
+    def _law_of(self, quest_name):
+        parts = str(quest_name).split('-')
+        return parts[1] if len(parts) >= 3 else None
+
+    def _top_snapshot(self, st):
+        if st is None: return None
+        return tuple((uid, st['users'][uid]['nickname'], st['users'][uid]['level'], st['users'][uid]['xp'])
+                     for _, _, uid in st['rank'][:LOBBY_LEADERS])
+
+    def _build_stats(self):
+        old = self._stats
+        users = {}
+        for r in self.get_safe_records(self.users_ws):
+            uid = str(r.get('user_id'))
+            if not uid: continue
+            users[uid] = {
+                'nickname': r.get('nickname') or uid.split('@')[0],
+                'level': to_int(r.get('level'), 1), 'xp': to_int(r.get('xp'), 0)
+            }
+        user_cards = {}
+        quest_cards = {}
+        for col_ws in self.collection_shards:
+            for r in self.get_safe_records(col_ws):
+                if r.get('type') != 'BLANK': continue
+                q = r.get('quest_name')
+                cards = user_cards.setdefault(str(r.get('user_id')), {})
+                cards[q] = cards.get(q, 0) + 1
+                quest_cards[q] = quest_cards.get(q, 0) + 1
+        self._stats = {
+            'built': time.time(), 'users': users, 'user_cards': user_cards, 'quest_cards': quest_cards,
+            'rank': sorted((-u['level'], -u['xp'], uid) for uid, u in users.items())
+        }
+        if old is None or self._top_snapshot(old) != self._top_snapshot(self._stats): self._bump('leaderboard')
+        old_pos = {uid: i for i, (_, _, uid) in enumerate(old['rank'])} if old else {}
+        for i, (_, _, uid) in enumerate(self._stats['rank']):
+            if old_pos.get(uid) != i: self._bump('leaderboard', user_id=uid)
+        self._bump('leaderboard_all')
+
+    def _ensure_stats(self):
+        if self._stats is None or time.time() - self._stats['built'] > STATS_REBUILD_TTL: self._build_stats()
+        return self._stats
+
+    def _stats_set_user(self, user_id, level=None, xp=None, nickname=None):
+        st = self._stats
+        if st is None: return
+        uid = str(user_id)
+        before = self._top_snapshot(st)
+        u = st['users'].get(uid)
+        old_i = None
+        if u is None:
+            u = {'nickname': uid.split('@')[0], 'level': 1, 'xp': 0}
+            st['users'][uid] = u
+        else:
+            i = bisect.bisect_left(st['rank'], (-u['level'], -u['xp'], uid))
+            if i < len(st['rank']) and st['rank'][i][2] == uid:
+                st['rank'].pop(i)
+                old_i = i
+        if level is not None: u['level'] = to_int(level, 1)
+        if xp is not None: u['xp'] = to_int(xp, 0)
+        if nickname: u['nickname'] = nickname
+        new_i = bisect.bisect_left(st['rank'], (-u['level'], -u['xp'], uid))
+        st['rank'].insert(new_i, (-u['level'], -u['xp'], uid))
+        if before != self._top_snapshot(st): self._bump('leaderboard')
+        if old_i != new_i:
+            # 사이에 있던 유저들의 순위가 한 칸씩 밀리거나 당겨짐 (새 유저는 뒤쪽 전체)
+            lo = new_i if old_i is None else min(old_i, new_i)
+            hi = len(st['rank']) - 1 if old_i is None else max(old_i, new_i)
+            for _, _, other in st['rank'][lo:hi + 1]: self._bump('leaderboard', user_id=other)
+            self._bump('leaderboard_all')
+        elif before != self._top_snapshot(st) or nickname:
+            self._bump('leaderboard_all')
+
+    def _stats_add_card(self, user_id, quest_name):
+        st = self._stats
+        if st is None: return
+        cards = st['user_cards'].setdefault(str(user_id), {})
+        cards[quest_name] = cards.get(quest_name, 0) + 1
+        st['quest_cards'][quest_name] = st['quest_cards'].get(quest_name, 0) + 1
+        self._bump('leaderboard_all')
+
+    def _stats_reset_user(self, user_id):
+        st = self._stats
+        if st is None: return
+        for q, n in st['user_cards'].pop(str(user_id), {}).items():
+            st['quest_cards'][q] = max(0, st['quest_cards'].get(q, 0) - n)
+        self._bump('leaderboard_all')
+        self._stats_set_user(user_id, level=1, xp=0)
+
+    def get_leaderboard(self, limit=10, user_id=None):
+        if not self.ensure_connection(): return [], None
+        st = self._ensure_stats()
+        top = []
+        for i, (_, _, uid) in enumerate(st['rank'][:limit]):
+            u = st['users'][uid]
+            top.append({'rank': i + 1, 'nickname': u['nickname'], 'level': u['level'], 'xp': u['xp'], 'is_me': uid == str(user_id)})
+        my_rank = None
+        u = st['users'].get(str(user_id))
+        if u: my_rank = bisect.bisect_left(st['rank'], (-u['level'], -u['xp'], str(user_id))) + 1
+        return top, my_rank
+
+    def get_law_stats(self):
+        # 법령별 획득 카드 수와 완료율 (획득 카드 / (조문 수 x 전체 유저 수)).
+        # 현재 quests에 있는 조문의 카드만 세므로 조문 삭제/합치기/나누기가 바로 반영됨
+        if not self.ensure_connection(): return []
+        st = self._ensure_stats()
+        law_quests = {}
+        law_cards = {}
+        for q in self.get_quest_view()[0]:
+            law = self._law_of(q.get('quest_name'))
+            if not law: continue
+            law_quests[law] = law_quests.get(law, 0) + 1
+            law_cards[law] = law_cards.get(law, 0) + st['quest_cards'].get(q.get('quest_name'), 0)
+        user_count = max(1, len(st['users']))
+        result = []
+        for law in sorted(law_quests):
+            cards = law_cards.get(law, 0)
+            total = law_quests.get(law, 0)
+            rate = min(100, round(cards * 100 / (total * user_count))) if total else 0
+            result.append({'law': law, 'quests': total, 'cards': cards, 'rate': rate})
+        return result
+
     def ensure_connection(self):
         try:
             self.users_ws.acell('A1')
@@ -91,29 +532,36 @@ class GoogleSheetManager:
         except:
             return self.connect_db()
 
-    def get_safe_records(self, worksheet):
+    def _invalidate(self, *worksheets):
+        # 쓰기 시도 후(성공/실패 무관) 해당 시트의 캐시 폐기
+        for ws in worksheets:
+            if ws is not None: self._table_cache.pop(ws.title, None)
+
+    def get_safe_records(self, worksheet, fresh=False):
+        # 캐시된 SheetTable의 행 목록 (읽기 전용). 수정이 필요하면 dict(row)로 복사.
+        # 행 번호로 쓰기 전에는 fresh=True로 시트를 새로 읽어야 함 (캐시는 읽기 전용 화면에만 사용)
         if worksheet is None: return []
         try:
             self.ensure_connection()
-            rows = worksheet.get_all_values()
-            if len(rows) < 2: return []
-            headers = rows[0]
-            records = []
-            for row in rows[1:]:
-                padded = row + [""] * (len(headers) - len(row))
-                records.append(dict(zip(headers, padded)))
-            return records
+            bucket = int(time.time() // max(1, TABLE_CACHE_TTL))
+            cached = self._table_cache.get(worksheet.title)
+            if not fresh and cached and cached[0] == bucket: return cached[1].rows
+            table = SheetTable(worksheet.get_all_values())
+            if fresh: self._table_cache.pop(worksheet.title, None)
+            else: self._table_cache[worksheet.title] = (bucket, table)
+            return table.rows
         except: return []
 
-    def get_user_by_id(self, user_id):
+    def get_user_by_id(self, user_id, fresh=False):
         if not self.ensure_connection(): return None, None
         try:
-            records = self.get_safe_records(self.users_ws)
+            records = self.get_safe_records(self.users_ws, fresh=fresh)
             for i, row in enumerate(records):
                 if str(row.get('user_id')) == str(user_id):
-                    row['points'] = int(row.get('points') or 0)
-                    row['level'] = int(row.get('level') or 1)
-                    row['xp'] = int(row.get('xp') or 0)
+                    row = dict(row)
+                    row['points'] = to_int(row.get('points'), 0)
+                    row['level'] = to_int(row.get('level'), 1)
+                    row['xp'] = to_int(row.get('xp'), 0)
                     if not row.get('nickname'): row['nickname'] = str(user_id).split('@')[0]
                     return row, i + 2
         except: pass
@@ -122,12 +570,15 @@ class GoogleSheetManager:
     def register_social(self, user_id):
         if not self.ensure_connection(): return False
         try:
-            if self.get_user_by_id(user_id)[0]: return True
+            if self.get_user_by_id(user_id, fresh=True)[0]: return True
             nick = user_id.split('@')[0]
             if self.users_ws:
                 self.users_ws.append_row([user_id, "SOCIAL", 1, 0, "빈칸 견습생", 0, 0, nick])
+                self._bump('users', user_id=user_id)
+                self._stats_set_user(user_id, level=1, xp=0, nickname=nick)
             return True
         except: return False
+        finally: self._invalidate(self.users_ws)
 
     def update_nickname(self, user_id, new_nick):
         if not self.ensure_connection(): return False
@@ -135,16 +586,19 @@ class GoogleSheetManager:
             cell = self.users_ws.find(user_id, in_column=1)
             if cell:
                 self.users_ws.update_cell(cell.row, 8, new_nick)
+                self._bump('users', user_id=user_id)
+                self._stats_set_user(user_id, nickname=new_nick)
                 return True
             return False
         except Exception as e:
             return False
+        finally: self._invalidate(self.users_ws)
 
     def save_split_quests(self, title_prefix, file_obj, creator):
         if not self.ensure_connection(): return False, "DB 접속 실패"
         try:
             today = str(datetime.date.today())
-            existing = [str(r.get('quest_name')) for r in self.get_safe_records(self.quests_ws)]
+            existing = [str(r.get('quest_name')) for r in self.get_safe_records(self.quests_ws, fresh=True)]
             rows_to_add = []
             
             filename = file_obj.filename.lower()
@@ -187,7 +641,7 @@ class GoogleSheetManager:
                             while any(r[0] == temp_name for r in rows_to_add) or temp_name in existing:
                                 dup_count += 1; temp_name = f"{final_title}_{dup_count}"
                             
-                            rows_to_add.append([temp_name, clean_content[:45000], creator, today])
+                            rows_to_add.append([temp_name, clean_content, creator, today])
             else:
                 f_stream = StringIO(raw_text)
                 normalized_text = raw_text.replace('\r\n', '\n')
@@ -210,26 +664,32 @@ class GoogleSheetManager:
                     dup_count = 0; temp_name = q_name
                     while any(r[0] == temp_name for r in rows_to_add) or temp_name in existing:
                         dup_count += 1; temp_name = f"{q_name}_{dup_count}"
-                    rows_to_add.append([temp_name, clean_block[:45000], creator, today])
+                    rows_to_add.append([temp_name, clean_block, creator, today])
             
             if rows_to_add: 
+                refs = self.put_bodies([r[1] for r in rows_to_add])
+                for r, ref in zip(rows_to_add, refs): r[1] = ref
                 self.quests_ws.append_rows(rows_to_add)
+                self._bump('quests')
                 return True, len(rows_to_add)
             return False, "추출된 내용이 없습니다. (파일 형식 확인)"
         except Exception as e: return False, str(e)
+        finally: self._invalidate(self.quests_ws)
 
     def delete_quest_group(self, prefix):
         if not self.ensure_connection(): return False
         try:
-            records = self.get_safe_records(self.quests_ws)
+            records = self.get_safe_records(self.quests_ws, fresh=True)
             to_del = []
             for i, r in enumerate(records):
                 q_name = str(r.get('quest_name'))
                 if f"-{prefix}-" in q_name:
                     to_del.append(i + 2)
             for idx in sorted(to_del, reverse=True): self.quests_ws.delete_rows(idx)
+            self._bump('quests')
             return True
         except: return False
+        finally: self._invalidate(self.quests_ws)
 
     def delete_quest_single(self, quest_name):
         if not self.ensure_connection(): return False
@@ -237,14 +697,16 @@ class GoogleSheetManager:
             cell = self.quests_ws.find(quest_name, in_column=1)
             if cell:
                 self.quests_ws.delete_rows(cell.row)
+                self._bump('quests')
                 return True
             return False
         except: return False
+        finally: self._invalidate(self.quests_ws)
 
     def merge_quests(self, quest_names, creator):
         if not self.ensure_connection() or not quest_names: return False
         try:
-            records = self.get_safe_records(self.quests_ws)
+            records = self.get_safe_records(self.quests_ws, fresh=True)
             to_merge = []
             to_del_indices = []
             for i, r in enumerate(records):
@@ -252,7 +714,9 @@ class GoogleSheetManager:
                     to_merge.append(r)
                     to_del_indices.append(i + 2)
             if not to_merge: return False
-            combined_content = "\n\n".join([q.get('content', '') for q in to_merge])
+            bodies = [self.get_body(q.get('content', ''), None) for q in to_merge]
+            if None in bodies: return False
+            combined_content = "\n\n".join(bodies)
             base_full_title = to_merge[0].get('quest_name')
             parts = base_full_title.split('-')
             if len(parts) >= 3:
@@ -260,11 +724,13 @@ class GoogleSheetManager:
                 new_title = f"{prefix}-{filename}-합본_{datetime.datetime.now().strftime('%H%M%S')}"
             else:
                 new_title = f"{base_full_title}-합본_{datetime.datetime.now().strftime('%H%M%S')}"
-            self.quests_ws.append_row([new_title, combined_content, creator, str(datetime.date.today())])
+            self.quests_ws.append_row([new_title, self.put_body(combined_content), creator, str(datetime.date.today())])
             for idx in sorted(to_del_indices, reverse=True):
                 self.quests_ws.delete_rows(idx)
+            self._bump('quests')
             return True
         except Exception as e: return False
+        finally: self._invalidate(self.quests_ws)
 
     def split_quest_by_paragraph(self, quest_name, creator):
         if not self.ensure_connection(): return False
@@ -272,7 +738,8 @@ class GoogleSheetManager:
             cell = self.quests_ws.find(quest_name, in_column=1)
             if not cell: return False
             row_val = self.quests_ws.row_values(cell.row)
-            content = row_val[1]
+            content = self.get_body(row_val[1], None)
+            if content is None: return False
             blocks = re.split(r'\n\s*\n', content)
             blocks = [b.strip() for b in blocks if b.strip()]
             if len(blocks) < 2: return False
@@ -280,36 +747,112 @@ class GoogleSheetManager:
             today = str(datetime.date.today())
             base_name = quest_name
             if '_' in base_name and 'part' in base_name: base_name = base_name.rsplit('_', 1)[0]
-            for idx, block in enumerate(blocks):
+            refs = self.put_bodies(blocks)
+            for idx, ref in enumerate(refs):
                 new_name = f"{base_name}_part{idx+1}"
-                rows_to_add.append([new_name, block, creator, today])
+                rows_to_add.append([new_name, ref, creator, today])
             self.quests_ws.append_rows(rows_to_add)
             self.quests_ws.delete_rows(cell.row)
+            self._bump('quests')
             return True
         except Exception as e: return False
+        finally: self._invalidate(self.quests_ws)
+
+    def _rename_ranges(self, old_name, new_name):
+        # quests/collections 샤드/abbreviations의 이름 열을 values_batch_get 1회로 새로 읽어
+        # old_name이 있는 셀을 values_batch_update용 range 목록으로 만듦. 첫 값은 quests 적중 수
+        targets = [(self.quests_ws, 'A')]
+        targets += [(col_ws, 'E') for col_ws in self.collection_shards]
+        targets.append((self.abbrev_ws, 'B'))
+        targets = [(ws, col) for ws, col in targets if ws is not None]
+        resp = self.sheet.values_batch_get([f"'{ws.title}'!{col}:{col}" for ws, col in targets])
+        data = []
+        quest_hits = 0
+        for (ws, col), vr in zip(targets, resp.get('valueRanges', [])):
+            for i, row in enumerate(vr.get('values', [])):
+                if i == 0 or not row or row[0] != old_name: continue
+                data.append({'range': f"'{ws.title}'!{col}{i + 1}", 'values': [[new_name]]})
+                if ws is self.quests_ws: quest_hits += 1
+        return quest_hits, data
+
+    def _apply_rename(self, old_name, new_name):
+        # quests에 old_name이 없으면 (이미 바뀌었거나 삭제됨) 다른 시트도 건드리지 않음
+        try:
+            quest_hits, data = self._rename_ranges(old_name, new_name)
+            if not quest_hits: return 0
+            self.sheet.values_batch_update({'valueInputOption': 'RAW', 'data': data})
+            self._bump('quests', 'collections', 'abbreviations')
+            self._stats = None
+            return quest_hits
+        finally:
+            self._invalidate(self.quests_ws, self.abbrev_ws, *self.collection_shards)
+
+    def _journal_rename(self, old_name, new_name):
+        # 일괄 반영 실패 시 기록해 두었다가 replay_renames()에서 다시 적용
+        entry = (old_name, new_name, str(datetime.datetime.now()))
+        self.pending_renames.append(entry)
+        try:
+            self.rename_journal_ws.append_row(list(entry))
+        except Exception as e:
+            print(f"Rename journal Error: {e} (이 프로세스 메모리에만 남음: {old_name} -> {new_name})")
+        finally: self._invalidate(self.rename_journal_ws)
+
+    def _drop_journal(self, entries=(), old_name=None):
+        # 다시 읽어서 entries에 있거나 old_name이 같은 행만 삭제 (그 사이 다른 워커가 추가한 기록은 남김)
+        entries = set(entries)
+        self.pending_renames = [e for e in self.pending_renames if e not in entries and e[0] != old_name]
+        if self.rename_journal_ws is None: return
+        try:
+            rows = self.rename_journal_ws.get_all_values()
+            done = [i + 1 for i, row in enumerate(rows)
+                    if i > 0 and (tuple((row + ["", "", ""])[:3]) in entries or (old_name is not None and row[0] == old_name))]
+            runs = []
+            for r in done:
+                if runs and runs[-1][1] == r - 1: runs[-1][1] = r
+                else: runs.append([r, r])
+            for a, b in reversed(runs): self.rename_journal_ws.delete_rows(a, b)
+        finally: self._invalidate(self.rename_journal_ws)
+
+    def replay_renames(self):
+        # 같은 old_name은 마지막 기록만 적용. quests에 old_name이 더 이상 없으면 (다른 경로로 이미 바뀜) 적용 없이 버림
+        if self._replaying or self.rename_journal_ws is None: return
+        self._replaying = True
+        try:
+            journal = [(r.get('old_name'), r.get('new_name'), r.get('date')) for r in self.get_safe_records(self.rename_journal_ws, fresh=True)]
+            pending = list(dict.fromkeys(journal + self.pending_renames))
+            if not pending: return
+            latest = {e[0]: e for e in pending}
+            for entry in pending:
+                if latest[entry[0]] == entry: self._apply_rename(entry[0], entry[1])
+            self._drop_journal(pending)
+        except Exception as e:
+            print(f"Rename replay Error: {e}")
+        finally:
+            self._invalidate(self.rename_journal_ws)
+            self._replaying = False
 
     def rename_quest(self, old_name, new_name):
-        if not self.ensure_connection(): return False
+        # True: 완료, False: quests에 old_name 없음, None: 일시 오류로 기록만 해 둠 (다음 이름 변경/재접속 때 재적용)
+        if not self.ensure_connection():
+            self._journal_rename(old_name, new_name)
+            return None
         try:
-            q_cell = self.quests_ws.find(old_name, in_column=1)
-            if q_cell: self.quests_ws.update_cell(q_cell.row, 1, new_name)
-            else: return False
-            try:
-                col_cells = self.collections_ws.findall(old_name, in_column=5) 
-                for cell in col_cells: self.collections_ws.update_cell(cell.row, 5, new_name)
-            except: pass
-            try:
-                abb_cells = self.abbrev_ws.findall(old_name, in_column=2) 
-                for cell in abb_cells: self.abbrev_ws.update_cell(cell.row, 2, new_name)
-            except: pass
-            return True
-        except Exception as e: return False
+            if not self._apply_rename(old_name, new_name): return False
+        except Exception as e:
+            self._journal_rename(old_name, new_name)
+            return None
+        # 성공했으니 같은 old_name의 이전 실패 기록은 버리고, 연결이 살아 있는 김에 남은 기록도 재적용
+        try: self._drop_journal(old_name=old_name)
+        except Exception as e: print(f"Rename journal Error: {e}")
+        self.replay_renames()
+        return True
 
     def get_quest_list(self):
         if not self.ensure_connection(): return []
         return self.get_safe_records(self.quests_ws)
 
-    def get_quest_content(self, quest_name):
+    def get_quest_ref(self, quest_name):
+        # quests.content 셀 값 (본문 참조 또는 예전 방식의 본문)
         if not self.ensure_connection(): return ""
         try:
             records = self.get_safe_records(self.quests_ws)
@@ -318,17 +861,20 @@ class GoogleSheetManager:
             return ""
         except: return ""
 
+    def get_quest_content(self, quest_name):
+        return self.get_body(self.get_quest_ref(quest_name))
+
     def get_my_progress(self, user_id):
         if not self.ensure_connection(): return []
         try:
-            col_records = self.get_safe_records(self.collections_ws)
+            col_records = self.get_safe_records(self._collection_ws(user_id))
             return [r for r in col_records if str(r.get('user_id')) == str(user_id)]
         except: return []
 
     def get_available_quests(self, user_id, mode):
         if not self.ensure_connection(): return []
         try:
-            all_quests = self.get_safe_records(self.quests_ws)
+            all_quests = self.get_quest_view()[0] if mode == 'acquire' else []
             my_cards = self.get_my_progress(user_id)
             my_quest_names = [c.get('quest_name') for c in my_cards if c.get('type') == 'BLANK']
             if mode == 'acquire': return [q for q in all_quests if q.get('quest_name') not in my_quest_names]
@@ -339,75 +885,135 @@ class GoogleSheetManager:
     def process_result(self, user_id, row_idx, quest_name, content, mode):
         if not self.ensure_connection(): return 0, 0
         try:
-            user_data, fresh_row_idx = self.get_user_by_id(user_id)
+            user_data, fresh_row_idx = self.get_user_by_id(user_id, fresh=True)
             if not user_data:
                 self.register_social(user_id)
-                user_data, fresh_row_idx = self.get_user_by_id(user_id)
+                user_data, fresh_row_idx = self.get_user_by_id(user_id, fresh=True)
             if not user_data: return 1, 0
-            records = self.get_safe_records(self.collections_ws)
+            col_ws = self._collection_ws(user_id)
+            records = self.get_safe_records(col_ws, fresh=True)
             target_type = 'ABBREV' if mode == 'abbrev' else 'BLANK'
             found_idx = -1; current_level = 0
             for i, row in enumerate(records):
                 if str(row.get('user_id')) == str(user_id) and row.get('quest_name') == quest_name and row.get('type') == target_type:
-                    found_idx = i + 2; current_level = int(row.get('level') or 0); break
+                    found_idx = i + 2; current_level = to_int(row.get('level'), 0); break
             xp_gain = 0
             try:
                 if found_idx == -1: 
                     grade = "RARE" if mode == 'abbrev' else "NORMAL"
-                    self.collections_ws.append_row([user_id, content, grade, str(datetime.date.today()), quest_name, 1, target_type])
+                    col_ws.append_row([user_id, self.put_body(content), grade, str(datetime.date.today()), quest_name, 1, target_type])
                     xp_gain = 100 if mode == 'abbrev' else 50
                 else: 
-                    self.collections_ws.update_cell(found_idx, 6, current_level + 1)
+                    col_ws.update_cell(found_idx, 6, current_level + 1)
                     xp_gain = 30 if mode == 'abbrev' else (20 + current_level * 5)
             except gspread.exceptions.APIError:
                 self.connect_db() 
+                col_ws = self._collection_ws(user_id)
                 if found_idx == -1:
-                    self.collections_ws.append_row([user_id, content, grade, str(datetime.date.today()), quest_name, 1, target_type])
+                    col_ws.append_row([user_id, self.put_body(content), grade, str(datetime.date.today()), quest_name, 1, target_type])
                 else:
-                    self.collections_ws.update_cell(found_idx, 6, current_level + 1)
+                    col_ws.update_cell(found_idx, 6, current_level + 1)
+            self._bump('collections', user_id=user_id)
+            if found_idx == -1 and target_type == 'BLANK': self._stats_add_card(user_id, quest_name)
             u_lv, new_xp = self.add_xp(user_id, xp_gain, user_data, fresh_row_idx)
             return u_lv, new_xp
         except Exception as e: raise e
+        finally: self._invalidate(self._collection_ws(user_id))
+
+    def process_results_bulk(self, user_id, results):
+        # 여러 카드 결과를 한 번에 반영: collections는 batch_update + append_rows 1회씩, XP는 add_xp 1회
+        # 아무것도 반영하지 못했으면 (None, None)을 돌려줘 호출 쪽에서 묶음을 유지하고 재시도하게 함
+        if not self.ensure_connection() or not results: return None, None
+        user_data, fresh_row_idx = self.get_user_by_id(user_id, fresh=True)
+        if not user_data:
+            self.register_social(user_id)
+            user_data, fresh_row_idx = self.get_user_by_id(user_id, fresh=True)
+        if not user_data: return None, None
+        col_ws = self._collection_ws(user_id)
+        try:
+            return self._apply_results_bulk(user_id, col_ws, results, user_data, fresh_row_idx)
+        finally: self._invalidate(col_ws)
+
+    def _apply_results_bulk(self, user_id, col_ws, results, user_data, fresh_row_idx):
+        records = self.get_safe_records(col_ws, fresh=True)
+        owned = {}
+        for i, row in enumerate(records):
+            if str(row.get('user_id')) == str(user_id) and row.get('type') == 'BLANK':
+                owned.setdefault(row.get('quest_name'), (i + 2, to_int(row.get('level'), 0)))
+        today = str(datetime.date.today())
+        updates = []
+        new_cards = []
+        xp_gain = 0
+        seen = set()
+        for quest_name, content in results:
+            if quest_name in seen: continue
+            seen.add(quest_name)
+            if quest_name in owned:
+                row_idx, current_level = owned[quest_name]
+                updates.append({'range': f"F{row_idx}", 'values': [[current_level + 1]]})
+                xp_gain += 20 + current_level * 5
+            else:
+                new_cards.append((quest_name, content))
+                xp_gain += 50
+        if new_cards:
+            refs = self.put_bodies([c for _, c in new_cards])
+            col_ws.append_rows([[user_id, ref, "NORMAL", today, q, 1, 'BLANK'] for (q, _), ref in zip(new_cards, refs)])
+        if updates: col_ws.batch_update(updates)
+        self._bump('collections', user_id=user_id)
+        for q, _ in new_cards: self._stats_add_card(user_id, q)
+        return self.add_xp(user_id, xp_gain, user_data, fresh_row_idx)
 
     def add_xp(self, user_id, amount, user_data=None, row_idx=None):
         if not self.ensure_connection(): return 1, 0
         if not user_data or not row_idx:
-            user_data, row_idx = self.get_user_by_id(user_id)
+            user_data, row_idx = self.get_user_by_id(user_id, fresh=True)
             if not user_data: return 1, 0
         try:
-            u_xp = int(user_data.get('xp', 0) or 0)
-            u_lv = int(user_data.get('level', 1) or 1)
+            u_xp = to_int(user_data.get('xp'), 0)
+            u_lv = to_int(user_data.get('level'), 1)
             new_xp = u_xp + amount
             req = u_lv * 100
             while new_xp >= req:
                 u_lv += 1; new_xp -= req; req = u_lv * 100
             self.users_ws.update_cell(row_idx, 3, u_lv)
             self.users_ws.update_cell(row_idx, 4, new_xp)
+            self._bump('users', user_id=user_id)
+            self._stats_set_user(user_id, level=u_lv, xp=new_xp)
             return u_lv, new_xp
         except gspread.exceptions.APIError:
             self.connect_db()
             self.users_ws.update_cell(row_idx, 3, u_lv)
             self.users_ws.update_cell(row_idx, 4, new_xp)
+            self._bump('users', user_id=user_id)
+            self._stats_set_user(user_id, level=u_lv, xp=new_xp)
             return u_lv, new_xp
+        finally: self._invalidate(self.users_ws)
 
     def update_quest_content(self, quest_name, new_content):
         if not self.ensure_connection(): return False
         try:
             cell = self.quests_ws.find(quest_name, in_column=1) 
-            if cell: self.quests_ws.update_cell(cell.row, 2, new_content); return True
+            if cell:
+                self.quests_ws.update_cell(cell.row, 2, self.put_body(new_content))
+                self._bump('quests')
+                return True
         except: return False
+        finally: self._invalidate(self.quests_ws)
 
     def save_mnemonic(self, user_id, quest_name, mnemonic):
         if not self.ensure_connection(): return False
         try:
-            records = self.get_safe_records(self.abbrev_ws)
+            records = self.get_safe_records(self.abbrev_ws, fresh=True)
             for i, r in enumerate(records):
                 if str(r.get('user_id')) == str(user_id) and r.get('quest_name') == quest_name:
                     self.abbrev_ws.update_cell(i + 2, 3, mnemonic)
+                    self._bump('abbreviations', user_id=user_id)
                     return True
             self.abbrev_ws.append_row([user_id, quest_name, mnemonic, str(datetime.date.today())])
+            self._bump('abbreviations', user_id=user_id)
             return True
         except: return False
+        finally: self._invalidate(self.abbrev_ws)
 
     def get_mnemonic(self, user_id, quest_name):
         if not self.ensure_connection(): return None
@@ -424,23 +1030,31 @@ class GoogleSheetManager:
 
     def add_abbreviation(self, user_id, term, meaning):
         if not self.ensure_connection(): return False
-        self.abbrev_ws.append_row([user_id, term, meaning, str(datetime.date.today())])
-        return True
+        try:
+            self.abbrev_ws.append_row([user_id, term, meaning, str(datetime.date.today())])
+            self._bump('abbreviations', user_id=user_id)
+            return True
+        finally: self._invalidate(self.abbrev_ws)
 
     def delete_abbreviation(self, user_id, term):
         if not self.ensure_connection(): return False
-        records = self.get_safe_records(self.abbrev_ws)
-        for i, r in enumerate(records):
-            if str(r.get('user_id')) == str(user_id) and r.get('term') == term:
-                self.abbrev_ws.delete_rows(i + 2); return True
-        return False
+        try:
+            records = self.get_safe_records(self.abbrev_ws, fresh=True)
+            for i, r in enumerate(records):
+                if str(r.get('user_id')) == str(user_id) and r.get('term') == term:
+                    self.abbrev_ws.delete_rows(i + 2)
+                    self._bump('abbreviations', user_id=user_id)
+                    return True
+            return False
+        finally: self._invalidate(self.abbrev_ws)
 
     def reset_user_data(self, user_id):
         if not self.ensure_connection(): return False
         try:
-            col_rows = self.collections_ws.get_all_values()
+            col_ws = self._collection_ws(user_id)
+            col_rows = col_ws.get_all_values()
             to_del_col = [i + 1 for i, row in enumerate(col_rows) if i > 0 and str(row[0]) == str(user_id)]
-            for r in sorted(to_del_col, reverse=True): self.collections_ws.delete_rows(r)
+            for r in sorted(to_del_col, reverse=True): col_ws.delete_rows(r)
             abb_rows = self.abbrev_ws.get_all_values()
             to_del_abb = [i + 1 for i, row in enumerate(abb_rows) if i > 0 and str(row[0]) == str(user_id)]
             for r in sorted(to_del_abb, reverse=True): self.abbrev_ws.delete_rows(r)
@@ -451,8 +1065,11 @@ class GoogleSheetManager:
             if cell:
                 self.users_ws.update_cell(cell.row, 3, 1) 
                 self.users_ws.update_cell(cell.row, 4, 0)
+            self._bump('collections', 'abbreviations', 'quest_log', 'users', user_id=user_id)
+            self._stats_reset_user(user_id)
             return True
         except Exception as e: return False
+        finally: self._invalidate(self._collection_ws(user_id), self.abbrev_ws, self.quest_log_ws, self.users_ws)
 
     # [중요] 여기 복구된 check_daily_login 함수입니다.
     def check_daily_login(self, user_id):
@@ -466,15 +1083,18 @@ class GoogleSheetManager:
     def claim_daily_login(self, user_id):
         if not self.ensure_connection(): return False, 0, 0
         today = str(datetime.date.today())
-        records = self.get_safe_records(self.quest_log_ws)
-        found = False
-        for i, r in enumerate(records):
-            if str(r.get('user_id')) == str(user_id):
-                if r.get('last_daily_login') == today: return False, 0, 0
-                self.quest_log_ws.update_cell(i + 2, 2, today)
-                found = True
-                break
-        if not found: self.quest_log_ws.append_row([user_id, today])
+        try:
+            records = self.get_safe_records(self.quest_log_ws, fresh=True)
+            found = False
+            for i, r in enumerate(records):
+                if str(r.get('user_id')) == str(user_id):
+                    if r.get('last_daily_login') == today: return False, 0, 0
+                    self.quest_log_ws.update_cell(i + 2, 2, today)
+                    found = True
+                    break
+            if not found: self.quest_log_ws.append_row([user_id, today])
+            self._bump('quest_log', user_id=user_id)
+        finally: self._invalidate(self.quest_log_ws)
         lv, xp = self.add_xp(user_id, 50)
         return True, lv, xp
 
@@ -521,6 +1141,39 @@ class GoogleSheetManager:
 
 gm = GoogleSheetManager()
 
+def build_blank_parts(content):
+    # "{정답}" 표시를 입력칸으로 바꾼 parts와 정답 목록
+    parts = []; targets = []
+    last = 0; idx = 0
+    for m in re.finditer(r'\{([^}]+)\}', content):
+        s, e = m.span()
+        if s > last: parts.append({'type':'text', 'val': content[last:s]})
+        parts.append({'type':'input', 'id': idx})
+        targets.append(m.group(1))
+        idx += 1; last = e
+    if last < len(content): parts.append({'type':'text', 'val': content[last:]})
+    return parts, targets
+
+@app.before_request
+def block_during_maintenance():
+    # 샤드 재배치 등 점검 중에는 시트를 건드리는 요청을 모두 막음
+    if request.endpoint in ('static', 'sw', 'index', 'logout'): return None
+    reason = gm.maintenance_reason()
+    if reason: return f"<h3>🛠 점검 중입니다</h3><p>{reason}. 잠시 후 다시 접속해주세요.</p>", 503
+    return None
+
+def conditional_page(page, tables, render):
+    # GET 요청만 ETag 처리. 플래시 메시지가 남아 있으면 항상 새로 렌더링
+    if request.method != 'GET' or session.get('_flashes'): return render()
+    etag = gm.page_etag(session['user_id'], page, tables)
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = make_response(render())
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
 @app.route('/')
 def index():
     if 'user_id' in session: return redirect(url_for('lobby'))
@@ -547,6 +1200,9 @@ def google_callback():
 @app.route('/lobby')
 def lobby():
     if 'user_id' not in session: return redirect(url_for('index'))
+    return conditional_page('lobby', ['users', 'quest_log', 'leaderboard'], render_lobby)
+
+def render_lobby():
     user, _ = gm.get_user_by_id(session['user_id'])
     
     if user: 
@@ -561,6 +1217,7 @@ def lobby():
         session['points'] = 0
 
     daily_checked = gm.check_daily_login(session['user_id'])
+    leaders, my_rank = gm.get_leaderboard(LOBBY_LEADERS, session['user_id'])
     
     return render_template('lobby.html', 
                            level=session.get('level', 1), 
@@ -568,7 +1225,17 @@ def lobby():
                            points=session.get('points', 0), 
                            nickname=session.get('nickname', '요원'), 
                            req_xp=session.get('level', 1)*100, 
-                           daily_checked=daily_checked)
+                           daily_checked=daily_checked,
+                           leaders=leaders, my_rank=my_rank)
+
+@app.route('/leaderboard')
+def leaderboard():
+    if 'user_id' not in session: return redirect(url_for('index'))
+    return conditional_page('leaderboard', ['leaderboard', 'leaderboard_all', 'quests'], render_leaderboard)
+
+def render_leaderboard():
+    leaders, my_rank = gm.get_leaderboard(50, session['user_id'])
+    return render_template('leaderboard.html', leaders=leaders, my_rank=my_rank, law_stats=gm.get_law_stats())
 
 @app.route('/logout')
 def logout():
@@ -606,8 +1273,10 @@ def zone_generate():
             else: flash("삭제 실패")
         elif 'rename_old' in request.form:
             old = request.form['rename_old']; new = request.form['rename_new']
-            if gm.rename_quest(old, new): flash("제목 수정 완료!")
-            else: flash("수정 실패")
+            renamed = gm.rename_quest(old, new)
+            if renamed: flash("제목 수정 완료!")
+            elif renamed is None: flash("일시 오류로 수정 실패 (기록해 두었다가 다음 제목 수정 또는 서버 재접속 때 자동 재적용)")
+            else: flash("수정 실패 (해당 퀘스트를 찾을 수 없음)")
         elif 'new_q_file' in request.files:
             f = request.files['new_q_file']
             ok, result = gm.save_split_quests(request.form['new_q_name'], f, session['user_id'])
@@ -620,13 +1289,14 @@ def zone_generate():
                 else: flash("합치기 실패.")
             else: flash("합칠 카드를 2개 이상 선택하세요.")
     
-    quests = gm.get_quest_list()
+    return conditional_page('generate', ['quests', 'collections'], render_zone_generate)
+
+def render_zone_generate():
+    quests, aligned_structure, others, my_drafted = gm.get_quest_view()
     my_progress = gm.get_my_progress(session['user_id'])
     my_completed = [c.get('quest_name') for c in my_progress if c.get('type') == 'BLANK']
     
-    aligned_structure, others = gm.align_quests(quests)
-    
-    return render_template('zone_generate.html', aligned_structure=aligned_structure, others=others, my_completed=my_completed, quests=quests)
+    return render_template('zone_generate.html', aligned_structure=aligned_structure, others=others, my_completed=my_completed, my_drafted=my_drafted, quests=quests)
 
 @app.route('/maker', methods=['GET', 'POST'])
 def maker():
@@ -637,7 +1307,7 @@ def maker():
         quests = gm.get_quest_list()
         quest = next((q for q in quests if q['quest_name'] == q_name), None)
         if not quest: return redirect(url_for('zone_generate'))
-        return render_template('maker.html', raw_text=quest['content'], title=q_name)
+        return render_template('maker.html', raw_text=gm.get_body(quest['content']), title=q_name)
     elif request.method == 'POST':
         if 'split_action' in request.form:
             q_name = request.form['title']
@@ -672,9 +1342,12 @@ def zone_acquire():
         if quest:
             ACTIVE_GAMES[session['user_id']] = { 'mode': 'acquire', 'quest_name': q_name, 'content': quest['content'] }
             return redirect(url_for('play_game'))
-    quests = gm.get_available_quests(session['user_id'], 'acquire')
+    return conditional_page('acquire', ['quests', 'collections'], lambda: render_zone_list('acquire', "획득 구역"))
+
+def render_zone_list(mode, title):
+    quests = gm.get_available_quests(session['user_id'], mode)
     aligned_structure, others = gm.align_quests(quests)
-    return render_template('zone_list.html', title="획득 구역", aligned_structure=aligned_structure, others=others, mode='acquire', quests=quests)
+    return render_template('zone_list.html', title=title, aligned_structure=aligned_structure, others=others, mode=mode, quests=quests)
 
 @app.route('/zone/review', methods=['GET', 'POST'])
 def zone_review():
@@ -688,15 +1361,13 @@ def zone_review():
             mode = 'abbrev' if q_type == 'ABBREV' else 'review'
             level = int(card.get('level', 1))
             if level == 5: mode = 'register_mnemonic'
-            latest_content = gm.get_quest_content(q_name)
+            latest_content = gm.get_quest_ref(q_name)
             final_content = latest_content if latest_content else card['card_text']
             ACTIVE_GAMES[session['user_id']] = { 
                 'mode': mode, 'quest_name': q_name, 'content': final_content, 'level': level
             }
             return redirect(url_for('play_game'))
-    cards = gm.get_available_quests(session['user_id'], 'review')
-    aligned_structure, others = gm.align_quests(cards)
-    return render_template('zone_list.html', title="복습 구역", aligned_structure=aligned_structure, others=others, mode='review', quests=cards)
+    return conditional_page('review', ['collections'], lambda: render_zone_list('review', "복습 구역"))
 
 @app.route('/zone/abbrev', methods=['GET', 'POST'])
 def zone_abbrev():
@@ -707,25 +1378,24 @@ def zone_abbrev():
         card = next((c for c in cards if c.get('quest_name') == q_name), None)
         if card:
             mnemonic = gm.get_mnemonic(session['user_id'], q_name)
-            latest_content = gm.get_quest_content(q_name)
+            latest_content = gm.get_quest_ref(q_name)
             final_content = latest_content if latest_content else card['card_text']
             ACTIVE_GAMES[session['user_id']] = { 
                 'mode': 'abbrev', 'quest_name': q_name, 'content': final_content,
                 'level': int(card.get('level', 1)), 'mnemonic': mnemonic
             }
             return redirect(url_for('play_game'))
-    cards = gm.get_available_quests(session['user_id'], 'abbrev')
-    aligned_structure, others = gm.align_quests(cards)
-    return render_template('zone_list.html', title="약어 훈련소", aligned_structure=aligned_structure, others=others, mode='abbrev', quests=cards)
+    return conditional_page('abbrev', ['collections'], lambda: render_zone_list('abbrev', "약어 훈련소"))
 
 @app.route('/play', methods=['GET', 'POST'])
 def play_game():
     if 'user_id' not in session: return redirect(url_for('index'))
     game = ACTIVE_GAMES.get(session['user_id'])
     if not game: return redirect(url_for('lobby'))
+    if game.get('mode') == 'session': return redirect(url_for('play_session'))
     current_level = game.get('level', 1)
     if request.method == 'GET':
-        content = game['content']
+        content = gm.get_body(game['content'])
         parts = []
         targets = []
         if game['mode'] == 'register_mnemonic':
@@ -744,30 +1414,30 @@ def play_game():
             ]
             targets = [clean.strip()] 
         else:
-            last = 0; idx = 0
-            for m in re.finditer(r'\{([^}]+)\}', content):
-                s, e = m.span()
-                if s > last: parts.append({'type':'text', 'val': content[last:s]})
-                parts.append({'type':'input', 'id': idx})
-                targets.append(m.group(1))
-                idx += 1; last = e
-            if last < len(content): parts.append({'type':'text', 'val': content[last:]})
+            parts, targets = build_blank_parts(content)
         return render_template('play.html', parts=parts, targets=targets, mode=game['mode'], title=game['quest_name'], level=current_level)
     elif request.method == 'POST':
         try:
             if game['mode'] == 'register_mnemonic':
                 user_mnemonic = request.form.get('user_mnemonic', '').strip()
                 if user_mnemonic:
+                    body = gm.get_body(game['content'], None)
+                    if body is None:
+                        flash(BODY_UNAVAILABLE_MSG)
+                        return redirect(url_for('play_game'))
                     gm.save_mnemonic(session['user_id'], game['quest_name'], user_mnemonic)
-                    lv, xp = gm.process_result(session['user_id'], session.get('user_row_idx'), game['quest_name'], game['content'], 'review')
+                    lv, xp = gm.process_result(session['user_id'], session.get('user_row_idx'), game['quest_name'], body, 'review')
                     session['level'] = lv; session['xp'] = xp
                     flash(f"약어 '{user_mnemonic}' 저장 완료! (약어 구역에서 테스트하세요)")
                     return redirect(url_for('zone_review'))
                 else:
                     flash("약어를 입력해주세요.")
                     return redirect(url_for('play_game'))
-            clean = game['content']
-            if game['mode'] != 'abbrev': clean = re.sub(r'\{([^}]+)\}', r'\1', game['content'])
+            clean = gm.get_body(game['content'], None)
+            if clean is None:
+                flash(BODY_UNAVAILABLE_MSG)
+                return redirect(url_for('play_game'))
+            if game['mode'] != 'abbrev': clean = re.sub(r'\{([^}]+)\}', r'\1', clean)
             lv, xp = gm.process_result(session['user_id'], session.get('user_row_idx'), game['quest_name'], clean, game['mode'])
             session['level'] = lv; session['xp'] = xp
             if game['mode'] == 'acquire': flash("획득완료")
@@ -776,6 +1446,91 @@ def play_game():
             return redirect(url_for(f"zone_{return_zone}"))
         except Exception as e: return f"<h3>⚠️ 오류 발생</h3><pre>{traceback.format_exc()}</pre><br><a href='/lobby'>로비로 돌아가기</a>"
 
+def build_session_cards(user_id, mode, law_name, only=None):
+    # 법령 하나(정렬된 조문 순서)의 카드 목록. only가 있으면 그 이름들만 (다음 묶음 이어하기)
+    if mode == 'review':
+        cards = [c for c in gm.get_available_quests(user_id, 'review')
+                 if c.get('type') == 'BLANK' and to_int(c.get('level'), 1) != 5]
+    else:
+        cards = gm.get_available_quests(user_id, 'acquire')
+    aligned_structure, _ = gm.align_quests(cards)
+    latest = {q.get('quest_name'): q.get('content', '') for q in gm.get_quest_view()[0]}
+    batch = []
+    for row in aligned_structure.get(law_name, []):
+        for key in ('law', 'decree', 'rule'):
+            c = row[key]
+            if not c or (only is not None and c.get('quest_name') not in only): continue
+            ref = latest.get(c.get('quest_name')) or c.get('card_text') or c.get('content', '')
+            batch.append({'quest_name': c.get('quest_name'), 'content': ref, 'level': to_int(c.get('level'), 1)})
+    return batch
+
+def start_session_batch(user_id, mode, law_name, only=None, done=0):
+    # SESSION_MAX_CARDS장씩 끊어서 시작하고 나머지 이름은 rest에 남겨 다음 묶음으로 이어감
+    cards = build_session_cards(user_id, mode, law_name, only)
+    if not cards: return False
+    ACTIVE_GAMES[user_id] = {'mode': 'session', 'session_mode': mode, 'law_name': law_name,
+                             'cards': cards[:SESSION_MAX_CARDS], 'rest': [c['quest_name'] for c in cards[SESSION_MAX_CARDS:]],
+                             'done': done, 'total': done + len(cards)}
+    return True
+
+@app.route('/play/session/start', methods=['POST'])
+def start_play_session():
+    if 'user_id' not in session: return redirect(url_for('index'))
+    game = ACTIVE_GAMES.get(session['user_id'])
+    if request.form.get('skip') and game and game.get('mode') == 'session':
+        # 현재 묶음을 제출하지 않고 다음 묶음으로 넘어감
+        started = game['rest'] and start_session_batch(session['user_id'], game['session_mode'], game['law_name'],
+                                                       set(game['rest']), game['done'] + len(game['cards']))
+        if started: return redirect(url_for('play_session'))
+        ACTIVE_GAMES.pop(session['user_id'], None)
+        flash("남은 카드가 없습니다.")
+        return redirect(url_for(f"zone_{game['session_mode']}"))
+    mode = 'review' if request.form.get('mode') == 'review' else 'acquire'
+    if not start_session_batch(session['user_id'], mode, request.form.get('law_name')):
+        flash("연속 학습할 카드가 없습니다.")
+        return redirect(url_for(f"zone_{mode}"))
+    return redirect(url_for('play_session'))
+
+@app.route('/play/session', methods=['GET', 'POST'])
+def play_session():
+    if 'user_id' not in session: return redirect(url_for('index'))
+    game = ACTIVE_GAMES.get(session['user_id'])
+    if not game or game.get('mode') != 'session': return redirect(url_for('lobby'))
+    mode = game['session_mode']
+    if request.method == 'GET':
+        cards = []
+        for c in game['cards']:
+            parts, targets = build_blank_parts(gm.get_body(c['content']))
+            cards.append({'quest_name': c['quest_name'], 'level': c['level'], 'parts': parts, 'targets': targets})
+        return render_template('play_session.html', cards=cards, mode=mode, title=game['law_name'],
+                               start=game['done'] + 1, total=game['total'], remaining=len(game['rest']))
+    try:
+        passed = set(request.form.getlist('passed'))
+        results = []
+        for c in game['cards']:
+            if c['quest_name'] not in passed: continue
+            body = gm.get_body(c['content'], None)
+            if body is None:
+                flash(BODY_UNAVAILABLE_MSG)
+                return redirect(url_for('play_session'))
+            results.append((c['quest_name'], re.sub(r'\{([^}]+)\}', r'\1', body)))
+        if not results:
+            flash("정답 처리된 카드가 없습니다.")
+            return redirect(url_for('play_session'))
+        lv, xp = gm.process_results_bulk(session['user_id'], results)
+        if lv is None:
+            # 저장하지 못했으면 묶음을 그대로 두어 다시 제출할 수 있게 함
+            flash("결과를 저장하지 못했습니다. 잠시 후 다시 제출해주세요.")
+            return redirect(url_for('play_session'))
+        session['level'] = lv; session['xp'] = xp
+        ACTIVE_GAMES.pop(session['user_id'], None)
+        if game['rest'] and start_session_batch(session['user_id'], mode, game['law_name'], set(game['rest']), game['done'] + len(game['cards'])):
+            flash(f"{len(results)}장 학습 완료! (현재 Lv.{lv}) 다음 {len(ACTIVE_GAMES[session['user_id']]['cards'])}장을 이어서 진행합니다.")
+            return redirect(url_for('play_session'))
+        flash(f"{len(results)}장 학습 완료! (현재 Lv.{lv})")
+        return redirect(url_for(f"zone_{mode}"))
+    except Exception as e: return f"<h3>⚠️ 오류 발생</h3><pre>{traceback.format_exc()}</pre><br><a href='/lobby'>로비로 돌아가기</a>"
+
 @app.route('/update_nickname', methods=['POST'])
 def update_nickname():
     if 'user_id' in session:
@@ -801,6 +1556,30 @@ def abbreviations():
         return redirect(url_for('abbreviations'))
     return render_template('abbreviations.html', abbrevs=gm.get_abbreviations(session['user_id']))
 
+@app.cli.command('rebalance-collections')
+def rebalance_collections_command():
+    # 점검 플래그를 켜고 모든 워커가 알아챌 때까지 기다린 뒤 실행. 실패하면 플래그를 그대로 두어 재실행하게 함
+    if not gm.ensure_connection() or gm.meta_ws is None:
+        print("DB 접속 실패"); return
+    gm.set_meta('maintenance', 1)
+    print(f"점검 모드 전환, {MAINTENANCE_CHECK_TTL + 5}초 대기...")
+    time.sleep(MAINTENANCE_CHECK_TTL + 5)
+    moved = gm.rebalance_collection_shards()
+    gm.set_meta('maintenance', 0)
+    print(f"{moved}개 행 이동 완료, 점검 모드 해제")
+
+@app.cli.command('migrate-bodies')
+def migrate_bodies_command():
+    # 예전 방식으로 본문이 셀에 직접 저장된 quests/collections 행을 bodies 참조로 일괄 변환. rebalance-collections와 같은 점검 절차
+    if not gm.ensure_connection() or gm.meta_ws is None:
+        print("DB 접속 실패"); return
+    gm.set_meta('maintenance', 1)
+    print(f"점검 모드 전환, {MAINTENANCE_CHECK_TTL + 5}초 대기...")
+    time.sleep(MAINTENANCE_CHECK_TTL + 5)
+    converted = gm.migrate_inline_bodies()
+    gm.set_meta('maintenance', 0)
+    print(f"{converted}개 본문 변환 완료, 점검 모드 해제")
+
 @app.route('/sw.js')
 def sw(): return app.send_static_file('sw.js')
 